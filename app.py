@@ -1,120 +1,279 @@
 """
-Flask API for RAG Application
+FastAPI app for RAG Application
 """
-from flask import Flask, request, jsonify
-from rag_engine import RAGEngine
+import hashlib
 import os
+import threading
 import time
-from flask_cors import CORS
+from contextlib import asynccontextmanager
+
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from rag_engine import RAGEngine
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+
+def _env_int(name: str, default: int, low: int, high: int) -> int:
+    """Read an integer setting, falling back to the default and clamping to [low, high]"""
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        print(f"Warning: {name} must be an integer, using {default}")
+        value = default
+    return min(max(value, low), high)
 
 # Load configuration
 DEBUG = os.environ.get("DEBUG", "True").lower() == "true"
+# Report per-stage /api/ask timings in logs and a Server-Timing header
+RAG_PROFILE = os.environ.get("RAG_PROFILE", "False").lower() == "true"
 PORT = int(os.environ.get("PORT", 5001))
+WORKERS = int(os.environ.get("WORKERS", 1))
 OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+LLM_MODEL = os.environ.get("LLM_MODEL", "llama3")
+# Dedicated embedding model; EMBED_DIM must match its output size (mxbai-embed-large: 1024)
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "nomic-embed-text")
+EMBED_DIM = int(os.environ.get("EMBED_DIM", 768))
+# 64 suits CPU/MPS hosts; raise to ~128 when Ollama runs on CUDA
+OLLAMA_EMBED_BATCH_SIZE = _env_int("OLLAMA_EMBED_BATCH_SIZE", 64, 1, 2048)
+# Concurrent embed batches; ~2 per Ollama node, capped so we don't overrun its parallel slots
+OLLAMA_EMBED_WORKERS = _env_int("OLLAMA_EMBED_WORKERS", 2, 1, 4)
+# Node size in tokens; larger chunks mean fewer embed calls and a smaller index
+RAG_CHUNK_SIZE = _env_int("RAG_CHUNK_SIZE", 1024, 128, 8192)
+RAG_CHUNK_OVERLAP = _env_int("RAG_CHUNK_OVERLAP", 100, 0, RAG_CHUNK_SIZE // 2)
+# Build the index at startup; set False on serverless hosts to defer all work to the first request
+PRELOAD_INDEX = os.environ.get("PRELOAD_INDEX", "True").lower() == "true"
+BASE_DIR = os.getcwd()
 
-# Initialize RAG engine
-rag_engine = RAGEngine(base_dir=os.getcwd(), ollama_base_url=OLLAMA_BASE_URL)
+# RAG engine, created on first use so cold starts only pay for what they need
+rag_engine: RAGEngine = None
+_engine_lock = threading.Lock()
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        "status": "healthy", 
-        "timestamp": time.time(),
-        "ollama_url": OLLAMA_BASE_URL,
-        "document_dir": rag_engine.document_dir
-    })
-
-@app.route('/api/ask', methods=['POST'])
-def ask_question():
-    
-    # Check if RAG engine is initialized
-    if rag_engine.index is None:
+# Short-TTL caches of encoded response bodies, in front of the engine's answer cache.
+# Only touched from the event loop, so no locking is needed.
+_health_cache = TTLCache(maxsize=1, ttl=60)
+_ask_cache = TTLCache(maxsize=1024, ttl=300)
+
+class AskRequest(BaseModel):
+    question: str
+    # Clients that only display the answer can skip the sources payload
+    include_sources: bool = True
+
+
+class ChatRequest(BaseModel):
+    message: str
+
+
+def _get_engine() -> RAGEngine:
+    global rag_engine
+    if rag_engine is None:
+        with _engine_lock:
+            if rag_engine is None:
+                rag_engine = RAGEngine(
+                    base_dir=BASE_DIR,
+                    ollama_base_url=OLLAMA_BASE_URL,
+                    llm_model=LLM_MODEL,
+                    embed_model=EMBED_MODEL,
+                    embed_dim=EMBED_DIM,
+                    embed_batch_size=OLLAMA_EMBED_BATCH_SIZE,
+                    embed_workers=OLLAMA_EMBED_WORKERS,
+                    chunk_size=RAG_CHUNK_SIZE,
+                    chunk_overlap=RAG_CHUNK_OVERLAP
+                )
+    return rag_engine
+
+
+def _get_loaded_engine() -> RAGEngine:
+    engine = _get_engine()
+    engine.ensure_loaded()
+    return engine
+
+
+async def _ensure_loaded() -> RAGEngine:
+    # Once loaded, skip the threadpool hop entirely
+    engine = rag_engine
+    if engine is None or not engine.is_loaded:
+        engine = await run_in_threadpool(_get_loaded_engine)
+    return engine
+
+
+def _sse(data: str, event: str = None) -> str:
+    """Format one server-sent event; multi-line data needs a data: prefix per line"""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def _sse_stream(first: str, chunks):
+    yield _sse(first)
+    try:
+        for chunk in chunks:
+            yield _sse(chunk)
+    except Exception as e:
+        yield _sse(f"Failed to process message: {str(e)}", event="error")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load data on startup
+    if PRELOAD_INDEX:
         try:
-            rag_engine.load_data()
+            await _ensure_loaded()
         except Exception as e:
-            return jsonify({"error": f"Failed to initialize RAG engine: {str(e)}"}), 500
-    
-    # Get question from request
-    data = request.get_json()
-    if not data or 'question' not in data:
-        return jsonify({"error": "Missing 'question' field in request"}), 400
-    
-    question = data['question']
-    if not question or not isinstance(question, str):
-        return jsonify({"error": "Question must be a non-empty string"}), 400
-    
-    # Process question
+            print(f"Warning: Failed to load data on startup: {e}")
+            print("You can load data later using the /api/reload endpoint")
+    yield
+    if rag_engine is not None:
+        rag_engine.close()
+
+
+# Initialize FastAPI app
+app = FastAPI(title="RAG API", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+# The string field each endpoint requires, for the error messages clients already rely on
+_REQUIRED_FIELDS = {"/api/ask": "question", "/api/chat": "message"}
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request, exc):
+    """Keep the 400 + {"error": ...} contract for malformed request bodies"""
+    field = _REQUIRED_FIELDS.get(request.url.path, "body")
+    for err in exc.errors():
+        loc = err["loc"]
+        name = loc[1] if len(loc) > 1 and isinstance(loc[1], str) else None
+        if name is None:
+            # No body, an empty or unparsable body, or not a JSON object
+            return ORJSONResponse({"error": f"Missing '{field}' field in request"}, status_code=400)
+        if err["type"] == "missing":
+            return ORJSONResponse({"error": f"Missing '{name}' field in request"}, status_code=400)
+        if name == field:
+            return ORJSONResponse({"error": f"{field.capitalize()} must be a non-empty string"}, status_code=400)
+    return ORJSONResponse({"error": "Invalid request body"}, status_code=400)
+
+
+@app.get('/health')
+async def health_check():
+    """Health check endpoint"""
+    body = _health_cache.get("health")
+    if body is None:
+        body = _health_cache["health"] = orjson.dumps({
+            "status": "healthy",
+            "timestamp": time.time(),
+            "ollama_url": OLLAMA_BASE_URL,
+            "document_dir": os.path.join(BASE_DIR, "DocumentDir")
+        })
+    return Response(body, media_type="application/json")
+
+
+@app.post('/api/ask')
+async def ask_question(data: AskRequest):
+
+    # Check if RAG engine is initialized
     try:
-        result = rag_engine.answer_question(question)
-        return jsonify(result)
+        engine = await _ensure_loaded()
     except Exception as e:
-        return jsonify({"error": f"Failed to process question: {str(e)}"}), 500
+        return ORJSONResponse({"error": f"Failed to initialize RAG engine: {str(e)}"}, status_code=500)
 
-@app.route('/api/reload', methods=['POST'])
-def reload_data():
+    question = data.question
+    if not question:
+        return ORJSONResponse({"error": "Question must be a non-empty string"}, status_code=400)
+
+    # Repeat questions are answered with the already-encoded body
+    key = hashlib.blake2b(f"{data.include_sources}:{question}".encode()).hexdigest()
+    body = _ask_cache.get(key)
+    if body is not None:
+        return Response(body, media_type="application/json")
+
+    # Process question; encoding here skips FastAPI's jsonable_encoder pass
+    try:
+        # When profiling, break out embed/retrieve/llm/fmt time in a Server-Timing header
+        timings = {} if RAG_PROFILE else None
+        generation = engine.index_generation
+        result = await run_in_threadpool(engine.answer_question, question, data.include_sources, timings)
+        body = orjson.dumps(result)
+        # Don't cache an answer from an index that was reloaded mid-request
+        if engine.index_generation == generation:
+            _ask_cache[key] = body
+        headers = None
+        if timings:
+            headers = {"Server-Timing": ", ".join(f"{stage};dur={us / 1000:.1f}" for stage, us in timings.items())}
+        return Response(body, media_type="application/json", headers=headers)
+    except Exception as e:
+        return ORJSONResponse({"error": f"Failed to process question: {str(e)}"}, status_code=500)
+
+
+@app.post('/api/reload')
+async def reload_data():
     """Reload document data and rebuild the index"""
     try:
-        result = rag_engine.load_data()
-        return jsonify({
-            "status": "success", 
+        engine = await run_in_threadpool(_get_engine)
+        result = await run_in_threadpool(engine.load_data)
+        _ask_cache.clear()
+        return {
+            "status": "success",
             "message": "Data reloaded successfully",
             "details": result
-        })
+        }
     except Exception as e:
-        return jsonify({"error": f"Failed to reload data: {str(e)}"}), 500
+        return ORJSONResponse({"error": f"Failed to reload data: {str(e)}"}, status_code=500)
+
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
+@app.post('/api/chat')
+async def chat(data: ChatRequest):
     """
     Simple chat interface for direct interaction.
-    
+
     Expected JSON input:
     {
         "message": "Your question here"
     }
-    
-    Returns the formatted response directly, not in JSON format.
+
+    Streams the formatted response as server-sent events (text/event-stream),
+    one data event per generated chunk, with the source footer as the last event.
     """
     # Check if RAG engine is initialized
-    if rag_engine.index is None:
-        try:
-            rag_engine.load_data()
-        except Exception as e:
-            return jsonify({"error": f"Failed to initialize RAG engine: {str(e)}"}), 500
-    
-    # Get message from request
-    data = request.get_json()
-    if not data or 'message' not in data:
-        return jsonify({"error": "Missing 'message' field in request"}), 400
-    
-    message = data['message']
-    if not message or not isinstance(message, str):
-        return jsonify({"error": "Message must be a non-empty string"}), 400
-    
+    try:
+        engine = await _ensure_loaded()
+    except Exception as e:
+        return ORJSONResponse({"error": f"Failed to initialize RAG engine: {str(e)}"}, status_code=500)
+
+    message = data.message
+    if not message:
+        return ORJSONResponse({"error": "Message must be a non-empty string"}, status_code=400)
+
     # Exit command (optional)
     if message.lower() == 'exit':
-        return "Thank you for reaching out. Feel free to visit us again.. byee"
-    
-    # Process question
+        goodbye = "Thank you for reaching out. Feel free to visit us again.. byee"
+        return StreamingResponse(iter([_sse(goodbye)]), media_type="text/event-stream")
+
+    # Process question; pull the first chunk here so retrieval errors still get a JSON 500
     try:
-        result = rag_engine.answer_question(message)
-        # Return just the answer, not the full JSON
-        return result['answer']
+        chunks = engine.stream_answer(message)
+        first = await run_in_threadpool(next, chunks, "")
     except Exception as e:
-        return jsonify({"error": f"Failed to process message: {str(e)}"}), 500
+        return ORJSONResponse({"error": f"Failed to process message: {str(e)}"}, status_code=500)
+
+    return StreamingResponse(_sse_stream(first, chunks), media_type="text/event-stream")
+
 
 if __name__ == '__main__':
-    # Load data on startup
-    try:
-        rag_engine.load_data()
-    except Exception as e:
-        print(f"Warning: Failed to load data on startup: {e}")
-        print("You can load data later using the /api/reload endpoint")
-    
-    # Start the Flask app
-    app.run(debug=DEBUG, host="0.0.0.0", port=PORT)
\ No newline at end of file
+    import uvicorn
+
+    # Start the ASGI server; multiple workers each load their own index.
+    # In production gunicorn runs the app with the settings in gunicorn.conf.py
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=PORT,
+        workers=WORKERS,
+        loop="uvloop",
+        http="httptools",
+        log_level="debug" if DEBUG else "info",
+    )
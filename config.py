@@ -4,3 +4,32 @@ PORT=5001
 
 # Ollama Configuration
 OLLAMA_BASE_URL=http://localhost:11434
+
+# ASGI server workers (each worker holds its own index)
+WORKERS=1
+
+# Ollama models: llama3 generates, a dedicated encoder embeds
+LLM_MODEL=llama3
+EMBED_MODEL=nomic-embed-text
+
+# Embedding dimension of EMBED_MODEL (nomic-embed-text: 768, mxbai-embed-large: 1024)
+EMBED_DIM=768
+
+# Texts per /api/embed request (1-2048; ~128 when Ollama runs on CUDA)
+OLLAMA_EMBED_BATCH_SIZE=64
+
+# Embed batches sent concurrently (1-4; about 2 per Ollama node)
+OLLAMA_EMBED_WORKERS=2
+
+# Build the index at startup (set False on serverless hosts for lazy init)
+PRELOAD_INDEX=True
+
+# Set on the Ollama server so regular requests don't reset the warm-up keep_alive
+OLLAMA_KEEP_ALIVE=24h
+
+# Document chunking (tokens); changing either re-embeds the corpus
+RAG_CHUNK_SIZE=1024
+RAG_CHUNK_OVERLAP=100
+
+# Per-stage /api/ask timings in logs and a Server-Timing header (off in production)
+RAG_PROFILE=False
@@ -0,0 +1,14 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+Azure App Service starts Python apps with `gunicorn app:app`; the app is ASGI,
+so it must run on uvicorn workers rather than gunicorn's default sync workers.
+"""
+import os
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+# Each worker loads its own index
+workers = int(os.environ.get("WORKERS", 1))
+# LLM generation and the first index build can take minutes
+timeout = 600
@@ -0,0 +1,94 @@
+"""
+Ollama embedding model that batches texts through the /api/embed endpoint
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Union
+
+import httpx
+from llama_index.core.base.embeddings.base import Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.embeddings.ollama import OllamaEmbedding
+from tqdm import tqdm
+
+# Seconds to wait for one /api/embed call; a full batch can take a while on CPU
+EMBED_TIMEOUT = 60.0
+
+
+class BatchedOllamaEmbedding(OllamaEmbedding):
+    """
+    OllamaEmbedding that sends a whole batch of texts in one /api/embed request
+    instead of one legacy /api/embeddings request per text.
+
+    Pass a shared ``http_client`` to reuse pooled keep-alive connections.
+    Batches are embedded concurrently by ``embed_workers`` threads; keep it
+    at or below the server's OLLAMA_NUM_PARALLEL slot count.
+    """
+
+    embed_workers: int = Field(
+        default=2,
+        description="Number of batches sent to Ollama concurrently.",
+        gt=0,
+    )
+
+    _http: httpx.Client = PrivateAttr()
+
+    def __init__(
+        self,
+        *args: Any,
+        embed_workers: int = 2,
+        http_client: Optional[httpx.Client] = None,
+        **kwargs: Any,
+    ) -> None:
+        # OllamaEmbedding.__init__ drops unknown kwargs, so set our fields afterwards
+        super().__init__(*args, **kwargs)
+        self.embed_workers = embed_workers
+        self._http = http_client or httpx.Client(timeout=EMBED_TIMEOUT)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchedOllamaEmbedding"
+
+    def _embed(self, texts: Union[str, List[str]]) -> List[List[float]]:
+        response = self._http.post(
+            f"{self.base_url}/api/embed",
+            json={
+                "model": self.model_name,
+                "input": texts,
+                "options": self.ollama_additional_kwargs,
+            },
+            timeout=EMBED_TIMEOUT,
+        )
+        if response.status_code != 200:
+            raise ValueError(
+                f"Ollama call failed with status code {response.status_code}."
+                f" Details: {response.text}"
+            )
+        return response.json()["embeddings"]
+
+    def get_general_text_embedding(self, prompt: str) -> List[float]:
+        """Get Ollama embedding."""
+        return self._embed(prompt)[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Get text embeddings for one batch in a single request."""
+        return self._embed(texts)
+
+    def get_text_embedding_batch(
+        self, texts: List[str], show_progress: bool = False, **kwargs: Any
+    ) -> List[Embedding]:
+        """Embed texts in embed_batch_size chunks fanned out over a thread pool, in order."""
+        batches = [
+            texts[i:i + self.embed_batch_size]
+            for i in range(0, len(texts), self.embed_batch_size)
+        ]
+        if len(batches) <= 1 or self.embed_workers == 1:
+            return super().get_text_embedding_batch(texts, show_progress=show_progress, **kwargs)
+
+        # Each worker runs the base implementation on a single batch, so callbacks
+        # and instrumentation events fire per batch exactly as in the serial path
+        embed_one = super().get_text_embedding_batch
+        with ThreadPoolExecutor(max_workers=min(self.embed_workers, len(batches))) as pool:
+            results = pool.map(lambda batch: embed_one(batch, **kwargs), batches)
+            if show_progress:
+                results = tqdm(results, total=len(batches), desc="Generating embeddings")
+            return [embedding for batch in results for embedding in batch]
@@ -1,16 +1,151 @@
+import json
+import multiprocessing
 import os
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings, PromptTemplate
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.llms.ollama import Ollama
-from typing import Dict, Any
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+import httpx
+import numpy as np
+from typing import TYPE_CHECKING, Dict, Any, Final, Iterator, List, Optional, Tuple
+
+# LlamaIndex, FAISS and the Ollama clients pull in a large import graph; they are
+# imported where first used so that importing this module (and /health) stays cheap
+if TYPE_CHECKING:
+    from llama_index.core import PromptTemplate, StorageContext, VectorStoreIndex
+    from llama_index.core.base.embeddings.base import BaseEmbedding
+    from llama_index.core.query_engine import BaseQueryEngine
+    from llama_index.core.schema import BaseNode
+
+# Answer cache settings: max entries per level and the L2 distance (between
+# unit-normalized query embeddings) under which two questions count as the same.
+# 0.15 corresponds to cosine similarity >= 0.989 (cos = 1 - d**2 / 2)
+ANSWER_CACHE_SIZE = 1024
+SEMANTIC_CACHE_THRESHOLD = 0.15
+
+# Characters of each source node's text returned in the API response
+MAX_TEXT_LEN = 200
+
+# How long Ollama keeps the models resident after the startup warm-up, and how
+# long warm-up waits for the (possibly multi-second) model load
+WARMUP_KEEP_ALIVE = "24h"
+WARMUP_TIMEOUT = 120.0
+
+# HNSW graph degree; higher trades memory and build time for recall
+HNSW_M = 32
+
+# Text QA template
+_TEXT_QA_STR: Final[str] = (
+    "Context information is"
+    " below.\n---------------------\n{context_str}\n---------------------\nUsing"
+    " both the context information and also using your own knowledge, answer"
+    " the question: {query_str}\nIf the context isn't helpful, you can also"
+    " answer the question on your own.\n"
+    " answer using facts but keep it clean and concise so that everyone can understand clearly"
+    " ensure you understand the users query and ask follow up questions if required"
+    " format the reponse and ensure it is presentable"
+    " Create table structure where needed in the response"
+)
+
+# Refine template
+_REFINE_STR: Final[str] = (
+    " You are an senior subject matter expert in the banking and finance domain"
+    " your speciality is payments. The queries you will get will be related to payments"
+    " Your users will be software developers, testers, product owners"
+    " Users will need help with Acceptance Criteria Generation"
+    " Test Design, Code review etc. Keeping the context in mind answer the question"
+    " The original question is as follows:\n {query_str} \n We have provided an"
+    " existing answer: {existing_answer}\n We have the opportunity to refine"
+    " the existing answer meeting the corporate standards with some more context"
+    " \n------------\n{context_msg}\n------------\n Using both the new"
+    " context and your own knowledge, update or repeat the existing answer.\n"
+    " ensure there is enough space above and below the query to maintain proper document format"
+    " Be precise with the answer and ensure answer is in tabular format where needed"
+)
+
+@lru_cache(maxsize=None)
+def _prompt_templates() -> Tuple["PromptTemplate", "PromptTemplate"]:
+    """Build the QA and refine templates once per process"""
+    from llama_index.core import PromptTemplate
+    
+    return PromptTemplate(_TEXT_QA_STR), PromptTemplate(_REFINE_STR)
+
+def _parse_file(path: str, chunk_size: int, chunk_overlap: int) -> List["BaseNode"]:
+    """Read one file and split it into nodes; runs in an ingestion worker process"""
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+    
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.get_nodes_from_documents(documents)
+
+def _format_source(node) -> Dict[str, Any]:
+    """Summarize a retrieved node for the API response"""
+    metadata = node.node.metadata
+    text = node.text
+    return {
+        'text': f"{text[:MAX_TEXT_LEN]}..." if len(text) > MAX_TEXT_LEN else text,
+        'score': float(node.score) if node.score is not None else None,
+        'file_name': metadata.get('file_name', 'Unknown'),
+        'page_label': metadata.get('page_label', 'Unknown')
+    }
+
+def _record_timings(timings: Optional[Dict[str, int]], **stages_ns: int):
+    """Store per-stage durations in microseconds and log them, when profiling"""
+    if timings is None:
+        return
+    timings.update((stage, ns // 1000) for stage, ns in stages_ns.items())
+    print(" ".join(f"{stage}={us}" for stage, us in timings.items()) + " µs")
 
 class RAGEngine:
-    def __init__(self, base_dir: str = os.getcwd(), ollama_base_url: str = "http://localhost:11434"):
+    __slots__ = (
+        "base_dir", "document_dir", "persist_dir", "manifest_path", "ollama_base_url",
+        "llm_model", "embed_model", "embed_dim", "embed_batch_size", "embed_workers",
+        "chunk_size", "chunk_overlap", "index", "query_engine", "streaming_query_engine",
+        "text_qa_template", "refine_template", "_embed_model", "_http", "_ready", "_init_lock",
+        "_cache_lock", "_exact_cache", "_sem_index", "_sem_vectors", "_sem_results",
+        "_generation",
+    )
+    
+    def __init__(self, base_dir: str = os.getcwd(), ollama_base_url: str = "http://localhost:11434",
+                 llm_model: str = "llama3", embed_model: str = "nomic-embed-text",
+                 embed_dim: int = 768, embed_batch_size: int = 64, embed_workers: int = 2,
+                 chunk_size: int = 1024, chunk_overlap: int = 100):
         
         self.base_dir = base_dir
         self.document_dir = os.path.join(base_dir, "DocumentDir")
+        self.persist_dir = os.path.join(base_dir, ".rag_cache")
+        self.manifest_path = os.path.join(self.persist_dir, "manifest.json")
         self.ollama_base_url = ollama_base_url
-        self.index = None
+        self.llm_model = llm_model
+        self.embed_model = embed_model
+        self.embed_dim = embed_dim
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.index: "VectorStoreIndex" = None
+        self.query_engine: "BaseQueryEngine" = None
+        self.streaming_query_engine: "BaseQueryEngine" = None
+        
+        # Set once the first index load finishes; the lock serializes (re)loads
+        self._ready = threading.Event()
+        self._init_lock = threading.Lock()
+        
+        # One pooled client for all of our own Ollama traffic
+        self._http = httpx.Client(
+            transport=httpx.HTTPTransport(retries=3),
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0)
+        )
+        
+        # Exact-match and semantic answer caches; the generation is bumped on every
+        # reset so answers computed against an older index are never stored
+        self._cache_lock = threading.Lock()
+        self._generation = 0
+        self._reset_cache()
         
         # Create document directory if it doesn't exist
         if not os.path.exists(self.document_dir):
@@ -20,122 +155,459 @@ class RAGEngine:
         # Setup Ollama embedding and LLM
         self._setup_ollama()
         
+        # Load model weights in the background so the first question doesn't pay for it
+        threading.Thread(target=self.warmup, name="ollama-warmup", daemon=True).start()
+        
         # Setup prompt templates
         self._setup_prompts()
         
         
     
     def _setup_ollama(self):
-        # Setup embedding model
-        ollama_embedding = OllamaEmbedding(
-            model_name="llama3",
+        from llama_index.core import Settings
+        from llama_index.llms.ollama import Ollama
+        from ollama_embedding import BatchedOllamaEmbedding
+        
+        # Setup embedding model; a dedicated encoder is much cheaper per token than
+        # the generation model, and batches go to Ollama as one /api/embed call each
+        ollama_embedding = BatchedOllamaEmbedding(
+            model_name=self.embed_model,
             base_url=self.ollama_base_url,
+            embed_batch_size=self.embed_batch_size,
+            embed_workers=self.embed_workers,
+            http_client=self._http,
             ollama_additional_kwargs={"mirostat": 0},
         )
         Settings.embed_model = ollama_embedding
+        self._embed_model: "BaseEmbedding" = ollama_embedding
         
-        # Setup LLM
-        Settings.llm = Ollama(model="llama3", base_url=self.ollama_base_url)
+        # Setup LLM, used for generation only
+        Settings.llm = Ollama(model=self.llm_model, base_url=self.ollama_base_url)
+    
+    def warmup(self):
+        """Ask Ollama to load the embedding and generation models and keep them resident"""
+        requests = [
+            ("/api/embed", {"model": self.embed_model, "input": "warmup"}),
+            # A generate call without a prompt only loads the model
+            ("/api/generate", {"model": self.llm_model}),
+        ]
+        for path, body in requests:
+            try:
+                response = self._http.post(
+                    f"{self.ollama_base_url}{path}",
+                    json={**body, "keep_alive": WARMUP_KEEP_ALIVE},
+                    timeout=WARMUP_TIMEOUT
+                )
+                response.raise_for_status()
+            except Exception as e:
+                print(f"Warning: Ollama warm-up via {path} failed: {e}")
+    
+    def close(self):
+        """Release pooled Ollama connections"""
+        self._http.close()
     
     def _setup_prompts(self):
         """Setup prompt templates for query and refinement"""
-        # Text QA template
-        text_qa_template_str = (
-            "Context information is"
-            " below.\n---------------------\n{context_str}\n---------------------\nUsing"
-            " both the context information and also using your own knowledge, answer"
-            " the question: {query_str}\nIf the context isn't helpful, you can also"
-            " answer the question on your own.\n"
-            " answer using facts but keep it clean and concise so that everyone can understand clearly"
-            " ensure you understand the users query and ask follow up questions if required"
-            " format the reponse and ensure it is presentable"
-            " Create table structure where needed in the response"
+        self.text_qa_template, self.refine_template = _prompt_templates()
+    
+    def _reset_cache(self):
+        """Drop all cached answers, e.g. after the index has been rebuilt"""
+        with self._cache_lock:
+            self._generation += 1
+            # Entries are (raw answer, source nodes); formatting happens per request
+            self._exact_cache: OrderedDict[str, Tuple[str, list]] = OrderedDict()
+            self._sem_index = None
+            self._sem_vectors: List[np.ndarray] = []
+            self._sem_results: List[Tuple[str, list]] = []
+    
+    def _cache_lookup(self, key: str, embedding: np.ndarray = None):
+        """Return a cached answer for the normalized question or its embedding, if any"""
+        with self._cache_lock:
+            if key in self._exact_cache:
+                self._exact_cache.move_to_end(key)
+                return self._exact_cache[key]
+            if embedding is None or self._sem_index is None or self._sem_index.ntotal == 0:
+                return None
+            # IndexFlatL2 reports squared distances
+            distances, ids = self._sem_index.search(embedding.reshape(1, -1), 1)
+            if ids[0][0] >= 0 and distances[0][0] < SEMANTIC_CACHE_THRESHOLD ** 2:
+                return self._sem_results[ids[0][0]]
+        return None
+    
+    def _cache_store(self, key: str, embedding: np.ndarray, entry: Tuple[str, list], generation: int):
+        with self._cache_lock:
+            if generation != self._generation:
+                # The index was reloaded while this answer was being generated
+                return
+            self._exact_cache[key] = entry
+            if len(self._exact_cache) > ANSWER_CACHE_SIZE:
+                self._exact_cache.popitem(last=False)
+            
+            if self._sem_index is None:
+                import faiss
+                
+                self._sem_index = faiss.IndexFlatL2(embedding.shape[0])
+            if len(self._sem_vectors) >= ANSWER_CACHE_SIZE:
+                # Evict the oldest half and rebuild; flat indexes have no cheap FIFO delete
+                keep = ANSWER_CACHE_SIZE // 2
+                self._sem_vectors = self._sem_vectors[-keep:]
+                self._sem_results = self._sem_results[-keep:]
+                self._sem_index.reset()
+                self._sem_index.add(np.vstack(self._sem_vectors))
+            self._sem_vectors.append(embedding)
+            self._sem_results.append(entry)
+            self._sem_index.add(embedding.reshape(1, -1))
+    
+    def _new_storage_context(self) -> "StorageContext":
+        """Storage backed by a FAISS HNSW graph instead of the brute-force in-memory store"""
+        import faiss
+        from llama_index.core import StorageContext
+        from llama_index.vector_stores.faiss import FaissVectorStore
+        
+        # Vectors are stored as float16 (half the memory and scan bandwidth of
+        # float32); queries stay float32 and are compared against the decoded values
+        faiss_index = faiss.IndexHNSWSQ(
+            self.embed_dim, faiss.ScalarQuantizer.QT_fp16, HNSW_M, faiss.METRIC_INNER_PRODUCT
         )
-        self.text_qa_template = PromptTemplate(text_qa_template_str)
-        
-        # Refine template
-        refine_template_str = (
-            " You are an senior subject matter expert in the banking and finance domain"
-            " your speciality is payments. The queries you will get will be related to payments"
-            " Your users will be software developers, testers, product owners"
-            " Users will need help with Acceptance Criteria Generation"
-            " Test Design, Code review etc. Keeping the context in mind answer the question"
-            " The original question is as follows:\n {query_str} \n We have provided an"
-            " existing answer: {existing_answer}\n We have the opportunity to refine"
-            " the existing answer meeting the corporate standards with some more context"
-            " \n------------\n{context_msg}\n------------\n Using both the new"
-            " context and your own knowledge, update or repeat the existing answer.\n"
-            " ensure there is enough space above and below the query to maintain proper document format"
-            " Be precise with the answer and ensure answer is in tabular format where needed"
+        vector_store = FaissVectorStore(faiss_index=faiss_index)
+        return StorageContext.from_defaults(vector_store=vector_store)
+    
+    def _scan_documents(self) -> Dict[str, List[float]]:
+        """Map each document file name to its [mtime, size]"""
+        manifest = {}
+        for entry in os.scandir(self.document_dir):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                manifest[entry.name] = [stat.st_mtime, stat.st_size]
+        return manifest
+    
+    def _index_settings(self) -> Dict[str, Any]:
+        """Settings that change the stored vectors; a mismatch invalidates the persisted index"""
+        return {
+            "embed_model": self.embed_model,
+            "embed_dim": self.embed_dim,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap
+        }
+    
+    def _read_manifest(self):
+        """Return the manifest of the persisted index, or None if it can't be reused"""
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("settings") != self._index_settings():
+                return None
+            return manifest["files"]
+        except Exception as e:
+            print(f"Warning: Unreadable manifest {self.manifest_path}, rebuilding index: {e}")
+            return None
+    
+    def _load_persisted_index(self):
+        """Load the index from persist_dir, or return None if the store is missing or damaged"""
+        from llama_index.core import StorageContext, load_index_from_storage
+        from llama_index.vector_stores.faiss import FaissVectorStore
+        
+        try:
+            vector_store = FaissVectorStore.from_persist_dir(self.persist_dir)
+            storage_context = StorageContext.from_defaults(
+                vector_store=vector_store, persist_dir=self.persist_dir
+            )
+            return load_index_from_storage(storage_context)
+        except Exception as e:
+            print(f"Warning: Failed to load index from {self.persist_dir}, rebuilding: {e}")
+            return None
+    
+    def _persist(self, files: Dict[str, List[float]]):
+        # Drop the old manifest first and write the new one last, atomically, so a
+        # crash anywhere in between forces a rebuild instead of reloading a
+        # half-written store or re-inserting files that were already persisted
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        self.index.storage_context.persist(persist_dir=self.persist_dir)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"settings": self._index_settings(), "files": files}, f)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def _check_embed_dim(self, embedding: List[float]):
+        """Fail with a clear message instead of a bare FAISS assertion when EMBED_DIM is wrong"""
+        if len(embedding) != self.embed_dim:
+            raise ValueError(
+                f"Embedding model {self.embed_model} returns {len(embedding)} dimensions "
+                f"but EMBED_DIM is {self.embed_dim}; set EMBED_DIM to match"
+            )
+    
+    def _embed_batches(self, batches: queue.Queue, abort: threading.Event):
+        """Embed nodes from the queue until a None sentinel arrives or abort is set"""
+        from llama_index.core.schema import MetadataMode
+        from tqdm import tqdm
+        
+        # Flush enough nodes at a time to keep every embed worker busy
+        flush_size = self.embed_batch_size * self.embed_workers
+        pending: List["BaseNode"] = []
+        # The total isn't known while files are still being parsed
+        progress = tqdm(desc="Generating embeddings", unit="chunk")
+        
+        def flush(nodes: List["BaseNode"]):
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+            embeddings = self._embed_model.get_text_embedding_batch(texts)
+            self._check_embed_dim(embeddings[0])
+            for node, embedding in zip(nodes, embeddings):
+                node.embedding = embedding
+            progress.update(len(nodes))
+        
+        while True:
+            nodes = batches.get()
+            if nodes is None or abort.is_set():
+                break
+            pending.extend(nodes)
+            while len(pending) >= flush_size and not abort.is_set():
+                flush(pending[:flush_size])
+                pending = pending[flush_size:]
+        if pending and not abort.is_set():
+            flush(pending)
+        progress.close()
+    
+    def _ingest(self, file_names: List[str]) -> List["BaseNode"]:
+        """
+        Parse files into nodes on a process pool while a consumer thread embeds
+        them, so CPU-bound PDF parsing overlaps with Ollama embedding calls.
+        """
+        paths = [os.path.join(self.document_dir, name) for name in file_names]
+        if not paths:
+            return []
+        
+        nodes: List["BaseNode"] = []
+        batches: queue.Queue = queue.Queue()
+        abort = threading.Event()
+        # spawn, not fork: the server process already runs threads holding locks
+        parsers = ProcessPoolExecutor(
+            max_workers=min(os.cpu_count() or 1, len(paths)),
+            mp_context=multiprocessing.get_context("spawn")
         )
-        self.refine_template = PromptTemplate(refine_template_str)
+        with parsers, ThreadPoolExecutor(max_workers=1) as embedder:
+            embedding = embedder.submit(self._embed_batches, batches, abort)
+            try:
+                futures = [
+                    parsers.submit(_parse_file, path, self.chunk_size, self.chunk_overlap)
+                    for path in paths
+                ]
+                for future in as_completed(futures):
+                    # The consumer only returns early on error (e.g. Ollama is down)
+                    if embedding.done():
+                        embedding.result()
+                    file_nodes = future.result()
+                    nodes.extend(file_nodes)
+                    batches.put(file_nodes)
+            except BaseException:
+                # Don't spend the rest of the corpus on a load that already failed
+                abort.set()
+                parsers.shutdown(cancel_futures=True)
+                raise
+            finally:
+                batches.put(None)
+            embedding.result()
+        
+        print(f"Parsed and embedded {len(nodes)} chunks from {len(paths)} files")
+        return nodes
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self._ready.is_set()
+    
+    @property
+    def index_generation(self) -> int:
+        """Changes whenever cached answers are invalidated, e.g. by a reload"""
+        return self._generation
     
-    def load_data(self) -> None:
+    def ensure_loaded(self):
+        """Load the index once; concurrent first callers wait on a single build"""
+        if self._ready.is_set():
+            return
+        with self._init_lock:
+            if not self._ready.is_set():
+                self._load_data()
+                self._ready.set()
+    
+    def load_data(self) -> Dict[str, Any]:
+        """(Re)build the index; runs exclusively with other loads"""
+        with self._init_lock:
+            result = self._load_data()
+            self._ready.set()
+            return result
+    
+    def _load_data(self) -> Dict[str, Any]:
+        from llama_index.core import VectorStoreIndex
         
         print(f"Loading documents from {self.document_dir}...")
         
         try:
-            # Load documents
-            documents = SimpleDirectoryReader(input_dir=self.document_dir).load_data()
-            print(f"Loaded {len(documents)} documents")
+            files = self._scan_documents()
+            cached_files = self._read_manifest()
+            
+            # Reuse the persisted index when files were only added; FAISS can't
+            # delete vectors, so any change or removal means a full rebuild
+            stale = cached_files is None or any(
+                files.get(name) != stat for name, stat in cached_files.items()
+            )
+            new_files = [name for name in files if cached_files is None or name not in cached_files]
             
-            # Create index
-            self.index = VectorStoreIndex.from_documents(documents)
-            print("Index created successfully")
+            # A damaged cache falls back to a full rebuild instead of failing every load
+            persisted = None if stale else self._load_persisted_index()
+            stale = persisted is None
+            
+            if stale:
+                # Load and embed documents
+                nodes = self._ingest(list(files))
+                
+                # Create index
+                self.index = VectorStoreIndex(nodes, storage_context=self._new_storage_context())
+                print("Index created successfully")
+            else:
+                self.index = persisted
+                print(f"Loaded index from {self.persist_dir}")
+                
+                nodes = self._ingest(new_files)
+                if nodes:
+                    self.index.insert_nodes(nodes)
+                    print(f"Added {len(new_files)} new files")
             
-            return {"status": "success", "document_count": len(documents)}
+            if stale or new_files:
+                self._persist(files)
+            
+            # Build the query engines once; they are rebuilt on every reload
+            self.query_engine = self.index.as_query_engine(
+                text_qa_template=self.text_qa_template,
+                refine_template=self.refine_template,
+                similarity_top_k=2
+            )
+            self.streaming_query_engine = self.index.as_query_engine(
+                text_qa_template=self.text_qa_template,
+                refine_template=self.refine_template,
+                similarity_top_k=2,
+                streaming=True
+            )
+            
+            # Cached answers may reference stale documents
+            self._reset_cache()
+            
+            return {
+                "status": "success",
+                "node_count": len(nodes),
+                "file_count": len(files),
+                "rebuilt": stale
+            }
         except Exception as e:
             print(f"Error loading documents: {str(e)}")
             raise
     
-    def answer_question(self, question: str) -> Dict[str, Any]:
-        if not self.index:
+    def _embed_question(self, question: str):
+        """Return the raw query embedding (for retrieval) and a unit-normalized copy (for the cache)"""
+        query_embedding = self._embed_model.get_query_embedding(question)
+        self._check_embed_dim(query_embedding)
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        embedding /= max(np.linalg.norm(embedding), 1e-12)
+        return query_embedding, embedding
+    
+    def _source_footer(self, source_nodes) -> str:
+        """Pointer to the source documents appended to the answer"""
+        if not source_nodes:
+            return ""
+        metadata = source_nodes[0].node.metadata
+        pages = ", ".join(node.node.metadata.get('page_label', 'Unknown') for node in source_nodes[:2])
+        return f"\n\n Check further at {metadata.get('file_name', 'Unknown')}, page nos: {pages}"
+    
+    def _build_result(self, question: str, answer: str, source_nodes,
+                      include_sources: bool = True) -> Dict[str, Any]:
+        # Format API response
+        result = {
+            'question': question,
+            'answer': answer + self._source_footer(source_nodes)
+        }
+        if include_sources:
+            result['raw_answer'] = str(answer)
+            result['sources'] = [_format_source(node) for node in source_nodes]
+        return result
+    
+    def answer_question(self, question: str, include_sources: bool = True,
+                        timings: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Answer a question from the indexed documents. With include_sources=False
+        only the question and answer are returned, skipping source formatting.
+        If a timings dict is passed, per-stage durations (µs) are recorded in it.
+        """
+        from llama_index.core import QueryBundle
+        
+        if not self.query_engine:
             raise ValueError("Index not initialized. Call load_data() first.")
         
-        # Create query engine with templates
-        query_engine = self.index.as_query_engine(
-            text_qa_template=self.text_qa_template,
-            refine_template=self.refine_template,
-            similarity_top_k=2
+        clock = time.perf_counter_ns
+        start = clock()
+        generation = self._generation
+        
+        # Serve repeated and near-duplicate questions from the cache
+        key = " ".join(question.lower().split())
+        cached = self._cache_lookup(key)
+        if cached is None:
+            query_embedding, embedding = self._embed_question(question)
+            cached = self._cache_lookup(key, embedding)
+        embedded = clock()
+        if cached is not None:
+            result = self._build_result(question, *cached, include_sources=include_sources)
+            _record_timings(timings, embed=embedded - start, fmt=clock() - embedded)
+            return result
+        
+        # Get response, reusing the query embedding for retrieval; retrieval and
+        # synthesis run as separate steps so each can be timed
+        query_bundle = QueryBundle(question, embedding=query_embedding)
+        nodes = self.query_engine.retrieve(query_bundle)
+        retrieved = clock()
+        response = self.query_engine.synthesize(query_bundle, nodes)
+        generated = clock()
+        self._cache_store(key, embedding, (response.response, response.source_nodes), generation)
+        
+        result = self._build_result(question, response.response, response.source_nodes, include_sources)
+        _record_timings(
+            timings,
+            embed=embedded - start,
+            retrieve=retrieved - embedded,
+            llm=generated - retrieved,
+            fmt=clock() - generated
         )
+        return result
+    
+    def stream_answer(self, question: str) -> Iterator[str]:
+        """
+        Yield the answer as it is generated, followed by the source footer.
+        Cached answers are yielded in one piece. Source nodes are never formatted
+        here since the chat client only shows the answer text.
+        """
+        from llama_index.core import QueryBundle
         
-        # Get response
-        response = query_engine.query(question)
+        if not self.streaming_query_engine:
+            raise ValueError("Index not initialized. Call load_data() first.")
         
-        # Format response with source information
-        if hasattr(response, 'source_nodes') and len(response.source_nodes) > 0:
-            if len(response.source_nodes) >= 2:
-                file_name = (response.source_nodes[0].text + 
-                            response.source_nodes[0].node.metadata['file_name'] + 
-                            "page nos: " + response.source_nodes[0].node.metadata['page_label'] + 
-                            ", " + response.source_nodes[1].node.metadata['page_label'])
-            else:
-                file_name = (response.source_nodes[0].text + 
-                            response.source_nodes[0].node.metadata['file_name'] + 
-                            "page nos: " + response.source_nodes[0].node.metadata['page_label'])
-            
-            final_response = response.response + '\n\n Check further at ' + file_name
-        else:
-            final_response = response.response
-        
-        # Extract source nodes for API response
-        source_documents = []
-        if hasattr(response, 'source_nodes'):
-            for node in response.source_nodes:
-                metadata = node.node.metadata if hasattr(node, 'node') else {}
-                source_documents.append({
-                    'text': node.text[:200] + "..." if len(node.text) > 200 else node.text,
-                    'score': float(node.score) if hasattr(node, 'score') else None,
-                    'file_name': metadata.get('file_name', 'Unknown'),
-                    'page_label': metadata.get('page_label', 'Unknown')
-                })
+        generation = self._generation
+        key = " ".join(question.lower().split())
+        cached = self._cache_lookup(key)
+        if cached is None:
+            query_embedding, embedding = self._embed_question(question)
+            cached = self._cache_lookup(key, embedding)
+        if cached is not None:
+            answer, source_nodes = cached
+            yield answer + self._source_footer(source_nodes)
+            return
         
-        # Format API response
-        result = {
-            'question': question,
-            'answer': final_response,
-            'raw_answer': str(response.response),
-            'sources': source_documents
-        }
+        response = self.streaming_query_engine.query(QueryBundle(question, embedding=query_embedding))
+        chunks = []
+        for chunk in response.response_gen:
+            chunks.append(chunk)
+            yield chunk
+        
+        footer = self._source_footer(response.source_nodes)
+        if footer:
+            yield footer
         
-        return result
\ No newline at end of file
+        self._cache_store(key, embedding, ("".join(chunks), response.source_nodes), generation)